@@ -11,17 +11,30 @@ Hot Chair Bot 🔥
 - Работает и в личке, и в группах
 """
 
+from __future__ import annotations
+
+import asyncio
 import json
 import os
 import re
+import time
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, time as dtime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, RateLimitError
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update,
+    BotCommand,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    MessageEntity,
+)
+from telegram.error import RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -40,6 +53,9 @@ TZ = ZoneInfo("Europe/Moscow")
 MIN_PEOPLE = 2
 
 DAYS_RU = ["Пн", "Вт", "Ср", "Чт", "Пт"]
+_DAY_ROWS = tuple(enumerate(DAYS_RU))  # готовые пары (i, имя) для циклов рендера
+_MARKER_OK = "🟢"
+_MARKER_BAD = "🔴"
 DAYS_FULL = ["понедельник", "вторник", "среда", "четверг", "пятница"]
 DAYS_MAP = {
     "пн": 0, "понедельник": 0, "понедельника": 0,
@@ -48,35 +64,139 @@ DAYS_MAP = {
     "чт": 3, "четверг": 3, "четверга": 3,
     "пт": 4, "пятница": 4, "пятницу": 4,
 }
+_DAY_DIGITS = {str(i): i for i in range(5)}  # "0".."4" из ACTION-строк
+# Первые две буквы однозначно определяют день во всех формах из DAYS_MAP
+# («пн»/«понедельник» → по/пн, «чт»/«четверг» → чт/че, ...)
+_DAY_PREFIX = {"пн": 0, "по": 0, "вт": 1, "ср": 2, "чт": 3, "че": 3, "пт": 4, "пя": 4}
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+# basicConfig откладываем до main(): импорт модуля (тесты, скрипты) не должен
+# трогать глобальную конфигурацию логирования
 logger = logging.getLogger(__name__)
 
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Явный httpx-клиент: HTTP/2 мультиплексирует параллельные completions по
+# одному соединению, пул пошире дефолтного — меньше ждём коннект под бёрстом.
+def _make_openai_client() -> AsyncOpenAI | None:
+    if not OPENAI_API_KEY:
+        return None
+    limits = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+    try:
+        http_client = httpx.AsyncClient(http2=True, limits=limits, timeout=30)
+    except ImportError:  # не установлен h2 — работаем по HTTP/1.1
+        http_client = httpx.AsyncClient(limits=limits, timeout=30)
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+
+
+openai_client = _make_openai_client()
 
 # ─── Хранилище ────────────────────────────────────────────────────────────────
+# data.json читается один раз при старте; все обработчики работают с _DATA
+# в памяти, а запись на диск откладывается и склеивается (debounce 500 мс),
+# чтобы не перечитывать/пересериализовывать файл на каждый апдейт.
+
+# orjson парсит/сериализует в разы быстрее stdlib; без него бот тоже работает
+try:
+    import orjson
+
+    def _loads(raw: bytes) -> dict:
+        return orjson.loads(raw)
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _loads(raw: bytes) -> dict:
+        return json.loads(raw)
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+# Дни пользователя в памяти — 5-битная маска (бит i = день i), проверка
+# «записан ли на день i» — одна целочисленная операция вместо скана списка.
+# На диске остаётся прежний формат со списками дней.
+
+def days_to_mask(days) -> int:
+    return sum(1 << d for d in set(days))
+
+
+def mask_to_days(mask: int) -> list[int]:
+    return [d for d in range(5) if mask >> d & 1]
+
 
 def load_data() -> dict:
     if DATA_FILE.exists():
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"weeks": {}, "group_chats": [], "names": {}}
+        data = _loads(DATA_FILE.read_bytes())
+        # В памяти чаты держим set-ом: O(1) проверка на каждый групповой апдейт
+        data["group_chats"] = set(data.get("group_chats", []))
+        data["weeks"] = {
+            wk: {uid: days_to_mask(days) for uid, days in week.items()}
+            for wk, week in data.get("weeks", {}).items()
+        }
+        return data
+    return {"weeks": {}, "group_chats": set(), "names": {}}
+
+
+_last_saved_hash: int | None = None
 
 
 def save_data(data: dict):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Атомарно: пишем во временный файл и подменяем, чтобы при падении
+    # посреди записи не остался битый data.json. Если байты не изменились
+    # с прошлой записи — диск не трогаем вовсе.
+    global _last_saved_hash
+    blob = dict(data)
+    blob["group_chats"] = sorted(data["group_chats"])  # на диске — список
+    blob["weeks"] = {
+        wk: {uid: mask_to_days(mask) for uid, mask in week.items()}
+        for wk, week in data["weeks"].items()
+    }
+    buf = _dumps(blob)
+    h = hash(buf)
+    if h == _last_saved_hash:
+        return
+    tmp = DATA_FILE.with_suffix(".json.tmp")
+    tmp.write_bytes(buf)
+    os.replace(tmp, DATA_FILE)
+    _last_saved_hash = h
+
+
+_DATA: dict = load_data()
+_version = 0  # растёт на каждой мутации; ключ для кэшей отрендеренных строк
+_dirty = False
+_flush_task: asyncio.Task | None = None
+_save_lock = asyncio.Lock()
+_SAVE_DELAY = 0.5  # секунд; несколько подряд идущих мутаций = одна запись
+
+
+def get_data() -> dict:
+    return _DATA
+
+
+def schedule_save():
+    """Помечаем данные изменёнными и планируем отложенную запись на диск."""
+    global _dirty, _flush_task, _version
+    _version += 1
+    _dirty = True
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_later())
+
+
+async def _flush_later():
+    global _dirty
+    await asyncio.sleep(_SAVE_DELAY)
+    async with _save_lock:
+        if not _dirty:
+            return
+        _dirty = False
+        save_data(_DATA)
 
 
 def register_group_chat(chat_id: int):
     """Запоминаем групповой чат для проактивных сообщений."""
-    data = load_data()
-    if chat_id not in data["group_chats"]:
-        data["group_chats"].append(chat_id)
-        save_data(data)
+    chats = _DATA["group_chats"]
+    if chat_id in chats:  # обычный случай — чат уже известен, диск не трогаем
+        return
+    chats.add(chat_id)
+    schedule_save()
 
 
 # ─── Утилиты ──────────────────────────────────────────────────────────────────
@@ -86,25 +206,52 @@ def week_key(dt: datetime) -> str:
     return monday.strftime("%Y-%m-%d")
 
 
+# Ключи недель меняются раз в неделю, а запрашиваются в каждом хендлере —
+# пересчитываем datetime.now + strftime не чаще раза в минуту
+_week_keys_minute: datetime | None = None
+_cached_cwk = ""
+_cached_nwk = ""
+
+
+def _refresh_week_keys():
+    global _week_keys_minute, _cached_cwk, _cached_nwk
+    now = datetime.now(TZ)
+    minute = now.replace(second=0, microsecond=0)
+    if minute != _week_keys_minute:
+        _week_keys_minute = minute
+        _cached_cwk = week_key(now)
+        _cached_nwk = week_key(now + timedelta(weeks=1))
+
+
 def current_week_key() -> str:
-    return week_key(datetime.now(TZ))
+    _refresh_week_keys()
+    return _cached_cwk
 
 
 def next_week_key() -> str:
-    return week_key(datetime.now(TZ) + timedelta(weeks=1))
+    _refresh_week_keys()
+    return _cached_nwk
 
 
+# Активных недель единицы, а рендеры — на каждый апдейт: strptime и strftime
+# дат недели выполняем по разу на ключ, дальше отдаём из lru_cache.
+@lru_cache(maxsize=64)
 def monday_of(wk: str) -> datetime:
     return datetime.strptime(wk, "%Y-%m-%d").replace(tzinfo=TZ)
 
 
+@lru_cache(maxsize=64)
+def _week_dates(wk: str) -> tuple[str, ...]:
+    """Даты "дд.мм" с понедельника по пятницу недели wk."""
+    mon = monday_of(wk)
+    return tuple((mon + timedelta(days=i)).strftime("%d.%m") for i in range(5))
+
+
 def parse_days(args: list[str]) -> list[int] | None:
-    days = []
-    for a in args:
-        key = a.lower().strip(",.")
-        if key in DAYS_MAP:
-            days.append(DAYS_MAP[key])
-    return sorted(set(days)) if days else None
+    # Только точное совпадение со словоформой из DAYS_MAP: по префиксу
+    # «потом» превращалось бы в понедельник, а предлог «по» — в день недели
+    days = {d for a in args if (d := DAYS_MAP.get(a.lower().strip(",."))) is not None}
+    return sorted(days) if days else None
 
 
 def get_display_name(user) -> str:
@@ -113,86 +260,219 @@ def get_display_name(user) -> str:
     return user.first_name or user.username or str(user.id)
 
 
+# По uid помним, из каких полей профиля собрано имя в _DATA["names"],
+# чтобы не пересобирать строку на каждый апдейт
+_name_src: dict[str, tuple] = {}
+
+
+def resolved_name(user) -> str:
+    """Имя пользователя из кэша; пересчитываем только если профиль изменился."""
+    uid = str(user.id)
+    key = (user.first_name, user.last_name, user.username)
+    if _name_src.get(uid) == key:
+        return _DATA["names"][uid]
+    name = get_display_name(user)
+    _name_src[uid] = key
+    if _DATA["names"].get(uid) != name:
+        _DATA["names"][uid] = name
+        schedule_save()
+    return name
+
+
+# Кэши отрендеренных строк: данные меняются редко, читаются на каждый апдейт.
+# Обычный dict с ключом по _version — lru_cache не подходит, data не хэшируется.
+_week_cache: dict[tuple, str] = {}
+_summary_cache: dict[tuple, str] = {}
+_index_cache: dict[str, list[list[str]]] = {}
+
+
+def week_index(data: dict, wk: str) -> list[list[str]]:
+    """Кто записан по дням недели: index[i] — список uid на день i.
+
+    Для незнакомой недели строится один раз (в т.ч. после рестарта),
+    дальше поддерживается инкрементально при каждом set/clear — чтение
+    не перебирает пользователей вовсе.
+    """
+    idx = _index_cache.get(wk)
+    if idx is None:
+        idx = [[] for _ in range(5)]
+        for uid, mask in data["weeks"].get(wk, {}).items():
+            for d in range(5):
+                if mask >> d & 1:
+                    idx[d].append(uid)
+        _index_cache[wk] = idx
+    return idx
+
+
+def _index_update_user(wk: str, uid: str, old_mask: int, new_mask: int):
+    """Правим индекс недели по дельте масок вместо полной перестройки."""
+    idx = _index_cache.get(wk)
+    if idx is None:
+        return  # индекс ещё не строился — при первом чтении соберётся уже новым
+    changed = old_mask ^ new_mask
+    for d in range(5):
+        if changed >> d & 1:
+            if new_mask >> d & 1:
+                idx[d].append(uid)
+            else:
+                idx[d].remove(uid)
+
+
 def format_week(data: dict, wk: str, label: str = "") -> str:
-    week_data = data["weeks"].get(wk, {})
+    cache_key = (_version, wk, label)
+    cached = _week_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    idx = week_index(data, wk)
     mon = monday_of(wk)
+    dates = _week_dates(wk)
     lines = []
-    header = mon.strftime("%d.%m") + " — " + (mon + timedelta(days=4)).strftime("%d.%m.%Y")
+    header = dates[0] + " — " + (mon + timedelta(days=4)).strftime("%d.%m.%Y")
     lines.append(f"📅 {label}{header}\n")
 
-    for i, day_name in enumerate(DAYS_RU):
-        date_str = (mon + timedelta(days=i)).strftime("%d.%m")
-        people = []
-        for uid, days_list in week_data.items():
-            if i in days_list:
-                people.append(data["names"].get(uid, f"id:{uid}"))
+    for i, day_name in _DAY_ROWS:
+        date_str = dates[i]
+        people = [data["names"].get(uid, f"id:{uid}") for uid in idx[i]]
         count = len(people)
-        marker = "🔴" if count < MIN_PEOPLE else "🟢"
+        marker = _MARKER_BAD if count < MIN_PEOPLE else _MARKER_OK
         people_str = ", ".join(people) if people else "—"
         lines.append(f"{marker} {day_name} ({date_str}):  [{count}]  {people_str}")
 
-    return "\n".join(lines)
+    text = "\n".join(lines)
+    if len(_week_cache) > 8:
+        _week_cache.clear()
+    _week_cache[cache_key] = text
+    return text
 
 
 def get_schedule_summary(data: dict) -> str:
     """Текстовая сводка для LLM контекста."""
+    cache_key = (_version, current_week_key())
+    cached = _summary_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     lines = []
     for wk_label, wk_key in [("Текущая неделя", current_week_key()),
                                ("Следующая неделя", next_week_key())]:
-        week_data = data["weeks"].get(wk_key, {})
+        idx = week_index(data, wk_key)
         mon = monday_of(wk_key)
         lines.append(f"\n{wk_label} ({mon.strftime('%d.%m.%Y')}):")
-        for i, day_name in enumerate(DAYS_RU):
-            people = []
-            for uid, days_list in week_data.items():
-                if i in days_list:
-                    people.append(data["names"].get(uid, uid))
+        for i, day_name in _DAY_ROWS:
+            people = [data["names"].get(uid, uid) for uid in idx[i]]
             count = len(people)
             status = "⚠️ НЕХВАТКА" if count < MIN_PEOPLE else "ОК"
             ppl = ", ".join(people) if people else "никто"
             lines.append(f"  {day_name}: {ppl} ({count} чел.) — {status}")
-    return "\n".join(lines)
 
+    text = "\n".join(lines)
+    if len(_summary_cache) > 2:
+        _summary_cache.clear()
+    _summary_cache[cache_key] = text
+    return text
 
-def problem_days_text(data: dict, wk: str) -> str:
-    week_data = data["weeks"].get(wk, {})
-    mon = monday_of(wk)
+
+_ALL_DAYS_OK = "✅ Все дни закрыты, минимум по 2 человека!"
+
+
+def _problem_day_lines(data: dict, wk: str) -> list[str]:
+    idx = week_index(data, wk)
+    dates = _week_dates(wk)
     problems = []
-    for i, day_name in enumerate(DAYS_RU):
-        count = sum(1 for days_list in week_data.values() if i in days_list)
+    for i, day_name in _DAY_ROWS:
+        count = len(idx[i])
         if count < MIN_PEOPLE:
             need = MIN_PEOPLE - count
-            date_str = (mon + timedelta(days=i)).strftime("%d.%m")
-            problems.append(f"  🔴 {day_name} ({date_str}) — нужно ещё {need} чел.")
+            problems.append(f"  {_MARKER_BAD} {day_name} ({dates[i]}) — нужно ещё {need} чел.")
+    return problems
+
+
+def problem_days_text(data: dict, wk: str) -> str:
+    problems = _problem_day_lines(data, wk)
     if not problems:
-        return "✅ Все дни закрыты, минимум по 2 человека!"
+        return _ALL_DAYS_OK
     return "\n".join(problems)
 
 
 def set_days_for_user(uid: str, name: str, days: list[int], wk: str) -> str:
-    data = load_data()
+    data = get_data()
+    new_mask = days_to_mask(days)
+    day_names = ", ".join(DAYS_RU[d] for d in days)
+    which = "эту неделю" if wk == current_week_key() else "следующую неделю"
+    result = f"✅ {name} будет в офисе на {which}: {day_names}"
+
+    # Повторный /set с теми же днями — частое «подтверждение»; ничего не меняем
+    if (data["weeks"].get(wk, {}).get(uid) == new_mask
+            and data["names"].get(uid) == name):
+        return result
+
     data["names"][uid] = name
     if wk not in data["weeks"]:
         data["weeks"][wk] = {}
-    data["weeks"][wk][uid] = days
-    save_data(data)
-    day_names = ", ".join(DAYS_RU[d] for d in days)
-    which = "эту неделю" if wk == current_week_key() else "следующую неделю"
-    return f"✅ {name} будет в офисе на {which}: {day_names}"
+    _index_update_user(wk, uid, data["weeks"][wk].get(uid, 0), new_mask)
+    data["weeks"][wk][uid] = new_mask
+    schedule_save()
+    return result
 
 
 def clear_days_for_user(uid: str, wk: str) -> str:
-    data = load_data()
+    data = get_data()
     which = "эту неделю" if wk == current_week_key() else "следующую неделю"
     if wk in data["weeks"] and uid in data["weeks"][wk]:
+        _index_update_user(wk, uid, data["weeks"][wk][uid], 0)
         del data["weeks"][wk][uid]
-        save_data(data)
+        schedule_save()
         return f"🗑 Записи на {which} убраны."
     return f"У тебя и так нет записей на {which}."
 
 
 # ─── LLM ──────────────────────────────────────────────────────────────────────
 
+# Проактивный лимитер запросов/токенов в минуту (по мотивам
+# api_request_parallel_processor из OpenAI cookbook): ждём свободную ёмкость
+# до запроса вместо того, чтобы ловить 429 и полагаться на слепые ретраи SDK.
+OPENAI_MAX_RPM = int(os.environ.get("OPENAI_MAX_REQUESTS_PER_MINUTE", "500"))
+OPENAI_MAX_TPM = int(os.environ.get("OPENAI_MAX_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_TOKENS = 400
+
+
+class _LLMRateLimiter:
+    def __init__(self, max_rpm: int, max_tpm: int, max_concurrency: int = 8):
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self.request_capacity = float(max_rpm)
+        self.token_capacity = float(max_tpm)
+        self.last_refill = time.monotonic()
+        self.sem = asyncio.Semaphore(max_concurrency)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_capacity = min(
+            self.max_rpm, self.request_capacity + self.max_rpm * elapsed / 60)
+        self.token_capacity = min(
+            self.max_tpm, self.token_capacity + self.max_tpm * elapsed / 60)
+
+    async def acquire(self, tokens: int):
+        while True:
+            self._refill()
+            if self.request_capacity >= 1 and self.token_capacity >= tokens:
+                self.request_capacity -= 1
+                self.token_capacity -= tokens
+                return
+            await asyncio.sleep(0.1)
+
+
+_llm_limiter = _LLMRateLimiter(OPENAI_MAX_RPM, OPENAI_MAX_TPM)
+
+
+def _estimate_tokens(*texts: str) -> int:
+    # Грубая оценка: ~4 символа на токен + бюджет ответа
+    return sum(len(t) for t in texts) // 4 + LLM_MAX_TOKENS
+
+
 SYSTEM_PROMPT = """Ты — Hot Chair Bot 🔥, бот для координации присутствия в офисе.
 Правило: каждый будний день в офисе должно быть минимум 2 человека.
 
@@ -222,6 +502,21 @@ ACTION:CLEAR:next             — убрать записи на следующ
 Отвечай КРАТКО, 1-3 предложения."""
 
 
+# Всплеск упоминаний (тред «кто завтра в офисе?» с десятком реплаев) не должен
+# превращаться в десяток запросов к OpenAI: сообщения, пришедшие в окно 200 мс,
+# склеиваются в один батч-запрос и разлетаются обратно по future-ам.
+_LLM_BATCH_WINDOW = 0.2  # секунд
+_LLM_BATCH_MAX = 8
+_llm_queue: asyncio.Queue | None = None
+_llm_batcher_task: asyncio.Task | None = None
+
+_BATCH_INSTRUCTION = """Ниже {n} НЕЗАВИСИМЫХ сообщений от разных пользователей, каждое со своим контекстом.
+Ответь КАЖДОМУ по обычным правилам (ACTION — внутри строки ответа, если нужен).
+Верни СТРОГО JSON-массив из {n} строк-ответов в том же порядке, без пояснений и без markdown."""
+
+_CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
 async def ask_llm(user_message: str, user_name: str, schedule_context: str) -> str:
     if not openai_client:
         return "🤖 LLM не подключен — задай OPENAI_API_KEY. Пока используй команды: /set, /week, /status"
@@ -234,25 +529,132 @@ async def ask_llm(user_message: str, user_name: str, schedule_context: str) -> s
 Текущее расписание офиса:
 {schedule_context}"""
 
+    global _llm_queue, _llm_batcher_task
+    if _llm_queue is None:
+        _llm_queue = asyncio.Queue()
+    if _llm_batcher_task is None or _llm_batcher_task.done():
+        _llm_batcher_task = asyncio.create_task(_llm_batcher())
+
+    fut = asyncio.get_running_loop().create_future()
+    await _llm_queue.put((user_message, context, fut))
+    return await fut
+
+
+async def _llm_batcher():
+    while True:
+        item = await _llm_queue.get()
+        if _llm_queue.empty():
+            # Одиночное сообщение — не придерживаем и не ждём ответа:
+            # await здесь сериализовал бы все чаты через один цикл батчера.
+            # Конкурентность ограничивает семафор лимитера.
+            asyncio.create_task(_resolve_single(item))
+            continue
+
+        batch = [item]
+        deadline = time.monotonic() + _LLM_BATCH_WINDOW
+        while len(batch) < _LLM_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_llm_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        if len(batch) == 1:
+            asyncio.create_task(_resolve_single(batch[0]))
+            continue
+        try:
+            replies = await _llm_complete_batch(batch)
+        except Exception as e:
+            logger.warning(f"LLM batch of {len(batch)} failed ({e}), falling back to singles")
+            # Параллельно, а не по очереди: цикл батчера один на всех, и
+            # восемь последовательных запросов заморозили бы LLM-трафик
+            # остальных чатов. Конкурентность ограничивает семафор лимитера.
+            await asyncio.gather(*(_resolve_single(it) for it in batch))
+            continue
+        for (_, _, fut), reply in zip(batch, replies):
+            if not fut.done():
+                fut.set_result(reply)
+
+
+async def _resolve_single(item):
+    user_message, context, fut = item
+    result = await _llm_complete_single(user_message, context)
+    if not fut.done():
+        fut.set_result(result)
+
+
+async def _llm_complete_single(user_message: str, context: str) -> str:
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": context},
+        {"role": "user", "content": user_message},
+    ]
+    await _llm_limiter.acquire(_estimate_tokens(SYSTEM_PROMPT, context, user_message))
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "system", "content": context},
-                {"role": "user", "content": user_message},
-            ],
-            max_tokens=400,
-            temperature=0.8,
-        )
+        async with _llm_limiter.sem:
+            try:
+                response = await openai_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    max_tokens=LLM_MAX_TOKENS,
+                    temperature=0.8,
+                )
+            except RateLimitError as e:
+                # Всё же проскочил 429 — ждём сколько просят и пробуем ещё раз
+                retry_after = float(
+                    (getattr(e, "response", None) and e.response.headers.get("retry-after"))
+                    or 1.0)
+                logger.warning(f"OpenAI 429, retry in {retry_after}s")
+                await asyncio.sleep(retry_after)
+                response = await openai_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    max_tokens=LLM_MAX_TOKENS,
+                    temperature=0.8,
+                )
         return response.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"OpenAI error: {e}")
         return f"😵 Мозги закоротило: {e}\nПопробуй команды: /set, /week"
 
 
+async def _llm_complete_batch(batch: list) -> list[str]:
+    """Один запрос на несколько сообщений; бросает исключение, если ответ не разобрался."""
+    n = len(batch)
+    blocks = [f"### Сообщение {i}\n{ctx}\n\nТекст: {msg}"
+              for i, (msg, ctx, _) in enumerate(batch, 1)]
+    joined = "\n\n".join(blocks)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": _BATCH_INSTRUCTION.format(n=n)},
+        {"role": "user", "content": joined},
+    ]
+    await _llm_limiter.acquire(
+        _estimate_tokens(SYSTEM_PROMPT, joined) + LLM_MAX_TOKENS * (n - 1))
+    async with _llm_limiter.sem:
+        response = await openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=LLM_MAX_TOKENS * n,
+            temperature=0.8,
+        )
+    raw = _CODE_FENCE_RE.sub("", response.choices[0].message.content.strip())
+    replies = json.loads(raw)
+    if not isinstance(replies, list) or len(replies) != n:
+        raise ValueError(f"expected JSON array of {n} replies")
+    return [str(r).strip() for r in replies]
+
+
+_ACTION_RE = re.compile(r"ACTION:(SET|CLEAR):?([0-4,]*):?(this|next)?")
+_ACTION_STRIP_RE = re.compile(r"\n?ACTION:(SET|CLEAR)[^\n]*")
+
+
 def parse_action(text: str) -> dict | None:
-    match = re.search(r"ACTION:(SET|CLEAR):?([0-4,]*):?(this|next)?", text)
+    if "ACTION:" not in text:  # обычный ответ без действия — самый частый случай
+        return None
+    match = _ACTION_RE.search(text)
     if not match:
         return None
     action_type = match.group(1)
@@ -261,7 +663,7 @@ def parse_action(text: str) -> dict | None:
     wk = current_week_key() if week_target == "this" else next_week_key()
 
     if action_type == "SET" and days_str:
-        days = sorted(set(int(d) for d in days_str.split(",") if d.isdigit() and 0 <= int(d) <= 4))
+        days = sorted({_DAY_DIGITS[d] for d in days_str.split(",") if d in _DAY_DIGITS})
         if days:
             return {"type": "SET", "days": days, "week": wk, "week_label": week_target}
     if action_type == "CLEAR":
@@ -270,7 +672,46 @@ def parse_action(text: str) -> dict | None:
 
 
 def strip_action_line(text: str) -> str:
-    return re.sub(r"\n?ACTION:(SET|CLEAR)[^\n]*", "", text).strip()
+    if "ACTION:" not in text:
+        return text.strip()
+    return _ACTION_STRIP_RE.sub("", text).strip()
+
+
+# ─── Быстрые интенты ─────────────────────────────────────────────────────────
+# Самые шаблонные просьбы («запиши меня на пн и ср», «убери меня со следующей
+# недели») разбираем регулярками и не тратим на них запрос к OpenAI.
+# Подтверждение кнопкой остаётся тем же — синтетический ответ с ACTION
+# проходит через обычный parse_action-флоу. Всё неоднозначное — в LLM.
+
+_FAST_SET_RE = re.compile(r"\b(запиши|записаться|буду|приду|пойду|выйду)\b", re.IGNORECASE)
+_FAST_CLEAR_RE = re.compile(r"\b(убери|удали|сотри|отмени)\b.*\b(меня|запис\w*|недел\w*)\b",
+                            re.IGNORECASE)
+# Дни во всех падежах («со среды», «в пятницу»); сопоставление через _DAY_PREFIX
+_FAST_DAY_RE = re.compile(
+    r"\b(пн|понедельник\w*|вт|вторник\w*|ср|сред[аыуео]\w*|чт|четверг\w*|пт|пятниц\w*)\b",
+    re.IGNORECASE)
+_FAST_NEXT_RE = re.compile(r"след\w*\.?\s*недел", re.IGNORECASE)  # и «след. неделя»
+_FAST_NEG_RE = re.compile(r"\b(не|кроме)\b", re.IGNORECASE)
+
+
+def _try_fast_intent(text: str) -> str | None:
+    """Синтетический ответ с ACTION для очевидных просьб, иначе None."""
+    if len(text) > 120 or "?" in text:  # вопросы и длинные тексты — в LLM
+        return None
+    if _FAST_NEG_RE.search(text):  # «не буду в пятницу», «кроме среды» — в LLM
+        return None
+    week = "next" if _FAST_NEXT_RE.search(text) else "this"
+    if _FAST_CLEAR_RE.search(text):
+        if _FAST_DAY_RE.search(text):
+            # «убери меня со среды» — это SET оставшихся дней, а не полный
+            # CLEAR; текущие записи знает только LLM-контекст
+            return None
+        return f"Понял без лишних слов 🪑\nACTION:CLEAR:{week}"
+    if _FAST_SET_RE.search(text):
+        days = sorted({_DAY_PREFIX[m[:2].lower()] for m in _FAST_DAY_RE.findall(text)})
+        if days:
+            return f"Принял 🪑\nACTION:SET:{','.join(str(d) for d in days)}:{week}"
+    return None
 
 
 # ─── Обработчики команд ──────────────────────────────────────────────────────
@@ -313,10 +754,10 @@ async def _do_set(update: Update, context: ContextTypes.DEFAULT_TYPE, wk: str, l
         await update.message.reply_text("Не понял дни. Используй: Пн, Вт, Ср, Чт, Пт")
         return
     uid = str(update.effective_user.id)
-    name = get_display_name(update.effective_user)
+    name = resolved_name(update.effective_user)
     result = set_days_for_user(uid, name, days, wk)
     await update.message.reply_text(result)
-    data = load_data()
+    data = get_data()
     problems = problem_days_text(data, wk)
     if "🔴" in problems:
         await update.message.reply_text(f"⚠️ На {label}:\n{problems}")
@@ -333,53 +774,93 @@ async def cmd_clearnext(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type != "private":
         register_group_chat(update.effective_chat.id)
-    data = load_data()
+    data = get_data()
     await update.message.reply_text(format_week(data, current_week_key(), "Эта неделя: "))
 
 async def cmd_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
+    data = get_data()
     await update.message.reply_text(format_week(data, next_week_key(), "След. неделя: "))
 
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    text = (
-        "📊 Эта неделя:\n" + problem_days_text(data, current_week_key()) + "\n\n"
-        "📊 Следующая неделя:\n" + problem_days_text(data, next_week_key())
-    )
+    data = get_data()
+    this_lines = _problem_day_lines(data, current_week_key()) or [_ALL_DAYS_OK]
+    next_lines = _problem_day_lines(data, next_week_key()) or [_ALL_DAYS_OK]
+    text = "\n".join([
+        "📊 Эта неделя:", *this_lines,
+        "",
+        "📊 Следующая неделя:", *next_lines,
+    ])
     await update.message.reply_text(text)
 
 
 # ─── LLM обработка текстовых сообщений ───────────────────────────────────────
+# Медленный ответ OpenAI не должен стопорить апдейты других чатов: сообщение
+# после фильтров уходит в очередь своего чата, которую разбирает отдельная
+# задача. Внутри чата порядок сохраняется, между чатами — параллельно.
+#
+# Отбор сообщений (личка / упоминание / reply) делают фильтры при регистрации
+# хендлеров — постороннюю групповую болтовню диспетчер отсекает ещё до нас.
 
-async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+_chat_queues: dict[int, asyncio.Queue] = {}
+_chat_workers: dict[int, asyncio.Task] = {}
+
+
+async def handle_private_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not update.message.text:
+        return
+    await _enqueue_text(update, context, update.message.text)
+
+
+async def handle_group_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Фильтры уже отобрали сообщения с упоминанием или reply; осталось
+    # дёшево проверить, что адресованы именно нам
     if not update.message or not update.message.text:
         return
+    register_group_chat(update.effective_chat.id)
 
-    chat_type = update.effective_chat.type
     text = update.message.text
+    # "@username" собирается один раз в _post_init, а не на каждое сообщение
+    mention = context.bot_data.get("mention") or f"@{context.bot.username or ''}"
+    is_mention = mention in text
+    is_reply = (
+        update.message.reply_to_message
+        and update.message.reply_to_message.from_user
+        and update.message.reply_to_message.from_user.id == context.bot.id
+    )
+    if not is_mention and not is_reply:
+        return
+    await _enqueue_text(update, context, text.replace(mention, "").strip())
 
-    # В группе реагируем только на @mention или reply
-    if chat_type != "private":
-        register_group_chat(update.effective_chat.id)
-        bot_username = context.bot.username or ""
-        is_mention = f"@{bot_username}" in text
-        is_reply = (
-            update.message.reply_to_message
-            and update.message.reply_to_message.from_user
-            and update.message.reply_to_message.from_user.id == context.bot.id
-        )
-        if not is_mention and not is_reply:
-            return
-        text = text.replace(f"@{bot_username}", "").strip()
 
+async def _enqueue_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
     if not text:
         return
+    chat_id = update.effective_chat.id
+    queue = _chat_queues.get(chat_id)
+    if queue is None:
+        queue = _chat_queues[chat_id] = asyncio.Queue()
+        _chat_workers[chat_id] = asyncio.create_task(_chat_worker(queue))
+    await queue.put((update, context, text))
 
-    data = load_data()
-    schedule = get_schedule_summary(data)
-    user_name = get_display_name(update.effective_user)
 
-    llm_response = await ask_llm(text, user_name, schedule)
+async def _chat_worker(queue: asyncio.Queue):
+    while True:
+        update, context, text = await queue.get()
+        try:
+            await _process_text(update, context, text)
+        except Exception as e:
+            logger.error(f"Text processing failed: {e}")
+        finally:
+            queue.task_done()
+
+
+async def _process_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    user_name = resolved_name(update.effective_user)
+
+    llm_response = _try_fast_intent(text)
+    if llm_response is None:
+        schedule = get_schedule_summary(get_data())
+        llm_response = await ask_llm(text, user_name, schedule)
     action = parse_action(llm_response)
     clean_text = strip_action_line(llm_response)
 
@@ -399,7 +880,12 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("✅ Да, давай", callback_data=cb),
             InlineKeyboardButton("❌ Не, отмена", callback_data="cancel"),
         ]])
-        await update.message.reply_text(clean_text + confirm_text, reply_markup=keyboard)
+        msg = await update.message.reply_text(clean_text + confirm_text, reply_markup=keyboard)
+        # Запоминаем текст до блока подтверждения, чтобы при клике не
+        # парсить его обратно из сообщения через rsplit. Храним только
+        # последнее подтверждение на чат: проигнорированные промпты иначе
+        # копились бы в chat_data навсегда, а для старых есть rsplit-фолбэк
+        context.chat_data["confirm_base"] = (msg.message_id, clean_text)
     else:
         if clean_text:
             await update.message.reply_text(clean_text)
@@ -411,10 +897,14 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     cb = query.data
     user_id = str(query.from_user.id)
-    user_name = get_display_name(query.from_user)
+    user_name = resolved_name(query.from_user)
 
     if cb == "cancel":
-        await query.edit_message_text(query.message.text.rsplit("\n\n", 1)[0] + "\n\n❌ Отменено.")
+        # Только убираем кнопки — текст сообщения не гоняем туда-обратно
+        cached = context.chat_data.get("confirm_base")
+        if cached is not None and cached[0] == query.message.message_id:
+            context.chat_data.pop("confirm_base", None)
+        await query.edit_message_reply_markup(reply_markup=None)
         return
 
     parts = cb.split(":")
@@ -426,10 +916,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         days = [int(d) for d in days_str.split(",")]
         result = set_days_for_user(target_uid, user_name, days, wk)
-        base_text = query.message.text.rsplit("\n\n", 1)[0]
+        base_text = _confirm_base_text(context, query)
         await query.edit_message_text(f"{base_text}\n\n{result}")
 
-        data = load_data()
+        data = get_data()
         problems = problem_days_text(data, wk)
         if "🔴" in problems:
             await query.message.reply_text(f"⚠️ Остались проблемные дни:\n{problems}")
@@ -440,24 +930,84 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.answer("Эта кнопка не для тебя 😏", show_alert=True)
             return
         result = clear_days_for_user(target_uid, wk)
-        base_text = query.message.text.rsplit("\n\n", 1)[0]
+        base_text = _confirm_base_text(context, query)
         await query.edit_message_text(f"{base_text}\n\n{result}")
 
 
+def _confirm_base_text(context: ContextTypes.DEFAULT_TYPE, query) -> str:
+    """Текст подтверждаемого сообщения без блока с вопросом."""
+    cached = context.chat_data.get("confirm_base")
+    if cached is not None and cached[0] == query.message.message_id:
+        context.chat_data.pop("confirm_base", None)
+        return cached[1]
+    # Фолбэк на вытесненные и старые (до рестарта) промпты: режем последний абзац
+    return query.message.text.rsplit("\n\n", 1)[0]
+
+
 # ─── Проактивные напоминания ──────────────────────────────────────────────────
 
+class TokenBucket:
+    """Лимитер исходящих сообщений: acquire спит до свободного токена."""
+
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill = refill_per_sec
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.refill)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.refill)
+
+
+# Telegram: ~30 сообщений/сек на бота глобально и ~1 сообщение/сек в один чат
+_send_bucket = TokenBucket(30, 30)
+_chat_buckets: dict[int, TokenBucket] = {}
+
+
+async def safe_send(bot, chat_id: int, text: str):
+    """send_message под токен-бакетами, чтобы рассылка не ловила RetryAfter штормом."""
+    per_chat = _chat_buckets.get(chat_id)
+    if per_chat is None:
+        per_chat = _chat_buckets[chat_id] = TokenBucket(1, 1)
+    await per_chat.acquire()
+    await _send_bucket.acquire()
+    try:
+        return await bot.send_message(chat_id=chat_id, text=text)
+    except RetryAfter as e:
+        logger.warning(f"Flood limit for {chat_id}, retry in {e.retry_after}s")
+        await asyncio.sleep(e.retry_after)
+        return await bot.send_message(chat_id=chat_id, text=text)
+
+
+async def _broadcast(bot, chat_ids, text: str):
+    """Рассылка в группы параллельно, а не по одной за RTT."""
+    chat_ids = list(chat_ids)
+    results = await asyncio.gather(*(safe_send(bot, c, text) for c in chat_ids),
+                                   return_exceptions=True)
+    for chat_id, res in zip(chat_ids, results):
+        if isinstance(res, Exception):
+            logger.warning(f"Send to {chat_id} failed: {res}")
+
+
 async def morning_reminder(context: ContextTypes.DEFAULT_TYPE):
     """09:00 МСК по будням — кто сегодня?"""
     now = datetime.now(TZ)
     if now.weekday() > 4:
         return
 
-    data = load_data()
+    data = get_data()
+    if not data["group_chats"]:  # слать некуда — не считаем расписание зря
+        return
     wk = current_week_key()
-    week_data = data["weeks"].get(wk, {})
     today_idx = now.weekday()
-    people = [data["names"].get(uid, uid) for uid, days in week_data.items() if today_idx in days]
-    count = len(people)
+    count = len(week_index(data, wk)[today_idx])
 
     if count < MIN_PEOPLE:
         need = MIN_PEOPLE - count
@@ -467,11 +1017,7 @@ async def morning_reminder(context: ContextTypes.DEFAULT_TYPE):
             f"Нужно ещё {need}! Кто спасёт ситуацию?\n\n"
             f"/set {day_name} или просто напиши мне «буду сегодня» 🪑🔥"
         )
-        for chat_id in data.get("group_chats", []):
-            try:
-                await context.bot.send_message(chat_id=chat_id, text=text)
-            except Exception as e:
-                logger.warning(f"Send to {chat_id} failed: {e}")
+        await _broadcast(context.bot, data.get("group_chats", []), text)
 
 
 async def midweek_lookahead(context: ContextTypes.DEFAULT_TYPE):
@@ -480,16 +1026,14 @@ async def midweek_lookahead(context: ContextTypes.DEFAULT_TYPE):
     if now.weekday() != 2:
         return
 
-    data = load_data()
-    wk = current_week_key()
-    week_data = data["weeks"].get(wk, {})
-    problems_this = [DAYS_RU[i] for i in [3, 4]
-                     if sum(1 for d in week_data.values() if i in d) < MIN_PEOPLE]
+    data = get_data()
+    if not data["group_chats"]:
+        return
+    idx = week_index(data, current_week_key())
+    problems_this = [DAYS_RU[i] for i in [3, 4] if len(idx[i]) < MIN_PEOPLE]
 
-    nwk = next_week_key()
-    nweek_data = data["weeks"].get(nwk, {})
-    problems_next = [DAYS_RU[i] for i in range(5)
-                     if sum(1 for d in nweek_data.values() if i in d) < MIN_PEOPLE]
+    nidx = week_index(data, next_week_key())
+    problems_next = [DAYS_RU[i] for i in range(5) if len(nidx[i]) < MIN_PEOPLE]
 
     if not problems_this and not problems_next:
         return
@@ -502,11 +1046,7 @@ async def midweek_lookahead(context: ContextTypes.DEFAULT_TYPE):
         lines.append("\n/setnext или напишите мне кто когда сможет 💬")
 
     text = "\n".join(lines)
-    for chat_id in data.get("group_chats", []):
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=text)
-        except Exception as e:
-            logger.warning(f"Send to {chat_id} failed: {e}")
+    await _broadcast(context.bot, data.get("group_chats", []), text)
 
 
 async def friday_nag(context: ContextTypes.DEFAULT_TYPE):
@@ -515,11 +1055,11 @@ async def friday_nag(context: ContextTypes.DEFAULT_TYPE):
     if now.weekday() != 4:
         return
 
-    data = load_data()
-    nwk = next_week_key()
-    nweek_data = data["weeks"].get(nwk, {})
-    empty = [DAYS_RU[i] for i in range(5)
-             if sum(1 for d in nweek_data.values() if i in d) < MIN_PEOPLE]
+    data = get_data()
+    if not data["group_chats"]:
+        return
+    nidx = week_index(data, next_week_key())
+    empty = [DAYS_RU[i] for i in range(5) if len(nidx[i]) < MIN_PEOPLE]
 
     if not empty:
         return
@@ -529,26 +1069,72 @@ async def friday_nag(context: ContextTypes.DEFAULT_TYPE):
         f"Не закрыты: {', '.join(empty)}\n\n"
         f"/setnext или напишите «на след неделе буду в ...»"
     )
-    for chat_id in data.get("group_chats", []):
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=text)
-        except Exception as e:
-            logger.warning(f"Send to {chat_id} failed: {e}")
+    await _broadcast(context.bot, data.get("group_chats", []), text)
+
+
+async def periodic_flush(context: ContextTypes.DEFAULT_TYPE):
+    """Страховочный сброс _DATA на диск, если отложенная запись не случилась."""
+    global _dirty
+    async with _save_lock:
+        if _dirty:
+            _dirty = False
+            save_data(_DATA)
 
 
 async def cleanup_old_weeks(context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
+    data = get_data()
     cutoff = (datetime.now(TZ) - timedelta(weeks=4)).strftime("%Y-%m-%d")
-    old = [k for k in data["weeks"] if k < cutoff]
+    weeks = data["weeks"]
+    # Ключи — ISO-даты, в отсортированном порядке можно остановиться
+    # на первой свежей неделе: работа пропорциональна числу удаляемых
+    old = []
+    for k in sorted(weeks):
+        if k >= cutoff:
+            break
+        old.append(k)
+    if not old:
+        return
     for k in old:
-        del data["weeks"][k]
-    if old:
-        save_data(data)
-        logger.info(f"Cleaned {len(old)} old weeks")
+        del weeks[k]
+        _index_cache.pop(k, None)
+    schedule_save()
+    logger.info(f"Cleaned {len(old)} old weeks")
 
 
 # ─── Запуск ───────────────────────────────────────────────────────────────────
 
+async def _post_init(app: Application):
+    app.bot_data["mention"] = f"@{app.bot.username}"
+    # Один вызов при старте — клиенты кэшируют меню команд локально
+    await app.bot.set_my_commands([
+        BotCommand("set", "отметить дни на эту неделю"),
+        BotCommand("setnext", "дни на следующую неделю"),
+        BotCommand("clear", "убрать свои дни (эта неделя)"),
+        BotCommand("clearnext", "убрать дни (след. неделя)"),
+        BotCommand("week", "расписание этой недели"),
+        BotCommand("next", "расписание следующей недели"),
+        BotCommand("status", "проблемные дни"),
+        BotCommand("help", "что умеет бот"),
+    ])
+
+
+async def _post_shutdown(app: Application):
+    # Финальный сброс: не ждём debounce и один раз fsync-аем файл.
+    # Во время работы os.replace даёт атомарность и без fsync на каждую запись.
+    global _dirty
+    if _dirty:
+        _dirty = False
+        save_data(_DATA)
+    try:
+        fd = os.open(DATA_FILE, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
 def main():
     if not BOT_TOKEN:
         print("❌ Установи BOT_TOKEN!")
@@ -559,7 +1145,16 @@ def main():
         print("⚠️  OPENAI_API_KEY не задан — LLM-общение отключено")
         print("   Команды будут работать\n")
 
-    app = Application.builder().token(BOT_TOKEN).build()
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+
+    app = (Application.builder()
+           .token(BOT_TOKEN)
+           .post_init(_post_init)
+           .post_shutdown(_post_shutdown)
+           .build())
 
     # Команды
     app.add_handler(CommandHandler("start", cmd_start))
@@ -576,16 +1171,23 @@ def main():
     app.add_handler(CallbackQueryHandler(handle_callback))
 
     # Текст → LLM
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    app.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE,
+        handle_private_text))
+    app.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & ~filters.ChatType.PRIVATE
+        & (filters.Entity(MessageEntity.MENTION) | filters.REPLY),
+        handle_group_text))
 
     # Расписание напоминаний
     jq = app.job_queue
-    t = lambda h, m=0: datetime.now(TZ).replace(hour=h, minute=m, second=0).timetz()
-
-    jq.run_daily(morning_reminder, time=t(9))           # Будни 09:00
-    jq.run_daily(midweek_lookahead, time=t(12), days=(2,))  # Среда 12:00
-    jq.run_daily(friday_nag, time=t(15), days=(4,))     # Пятница 15:00
-    jq.run_daily(cleanup_old_weeks, time=t(3), days=(0,))   # Пн 03:00 очистка
+    # Фиксированные времена, а не datetime.now().replace(...): текущие
+    # секунды/микросекунды рестарта не просачиваются в расписание
+    jq.run_daily(morning_reminder, time=dtime(9, 0, tzinfo=TZ))            # Будни 09:00
+    jq.run_daily(midweek_lookahead, time=dtime(12, 0, tzinfo=TZ), days=(2,))  # Среда 12:00
+    jq.run_daily(friday_nag, time=dtime(15, 0, tzinfo=TZ), days=(4,))      # Пятница 15:00
+    jq.run_daily(cleanup_old_weeks, time=dtime(3, 0, tzinfo=TZ), days=(0,))   # Пн 03:00 очистка
+    jq.run_repeating(periodic_flush, interval=30, first=30)  # страховка записи
 
     logger.info("🔥 Hot Chair Bot запущен!")
     app.run_polling(allowed_updates=Update.ALL_TYPES)